@@ -225,17 +225,24 @@ class RunTable (Table):
 
     listBackups_withhost = "SELECT r.id, h.host, r.starttime, r.endtime, s.status FROM run_v1 r, host_v1 h, status_v1 s WHERE h.host = ? AND r.endtime >= ? AND r.starttime <= ? AND h.id = r.host_id AND s.id = r.status_id ORDER BY r.starttime"
     
-    def __init__(self, dbh, readOnly = False, create = False, reset = False):
+    def __init__(self, dbh, readOnly = False, create = False, reset = False, statusTable = None, hostTable = None):
         """Initializes the RunTable object.  This differs from the generic
         Table type because it also needs an instance of StatusTable
-        and HostTable for reference.
+        and HostTable for reference.  Existing instances may be passed
+        in to be shared; otherwise new ones are made.
 
         """
 
         self.dbh = dbh
         self.readOnly = readOnly
-        self.statusTable = StatusTable(dbh, readOnly)
-        self.hostTable = HostTable(dbh, readOnly)
+
+        if (statusTable is None):
+            statusTable = StatusTable(dbh, readOnly)
+        if (hostTable is None):
+            hostTable = HostTable(dbh, readOnly)
+
+        self.statusTable = statusTable
+        self.hostTable = hostTable
 
         if (reset):
             create = True
@@ -332,15 +339,19 @@ class DirectoryTable (Table):
     
     restoreList_select_subject = "SELECT p.filepath, d.fileowner, d.filegroup, d.filemode, d.filetime FROM directory_v1 d JOIN filepath_v1 p ON d.filepath_id = p.id WHERE d.run_id = ? AND p.filepath LIKE ?||'%'"
     
-    def __init__(self, dbh, readOnly = False, create = False, reset = False):
+    def __init__(self, dbh, readOnly = False, create = False, reset = False, filepathTable = None):
         """Sets up the DirectoryTable object.  In addition to the basics, this
-        instantiates a FilePathTable and puts it on the DirectoryTable
-        object for reference use.
+        instantiates a FilePathTable (unless one is passed in) and
+        puts it on the DirectoryTable object for reference use.
 
         """
         self.dbh = dbh
         self.readOnly = readOnly
-        self.filepathTable = FilepathTable(dbh, readOnly)
+
+        if (filepathTable is None):
+            filepathTable = FilepathTable(dbh, readOnly)
+
+        self.filepathTable = filepathTable
 
         if (reset):
             create = True
@@ -426,15 +437,20 @@ class LinkTable (Table):
     
     restoreList_select_subject = "SELECT s.filepath, d.filepath FROM link_v1 l JOIN filepath_v1 s ON l.filepath_id = s.id JOIN filepath_v1 d ON l.destpath_id = d.id WHERE l.run_id = ? AND s.filepath LIKE ?||'%'"
     
-    def __init__(self, dbh, readOnly = False, create = False, reset = False):
+    def __init__(self, dbh, readOnly = False, create = False, reset = False, filepathTable = None):
         """Sets up the LinkTable object.  As with other filesystem objects,
         this is being overridden so that we can put a FilepathTable
-        object on this object for reference purposes.
+        object (new, or shared if one is passed in) on this object for
+        reference purposes.
 
         """
         self.dbh = dbh
         self.readOnly = readOnly
-        self.filepathTable = FilepathTable(dbh, readOnly)
+
+        if (filepathTable is None):
+            filepathTable = FilepathTable(dbh, readOnly)
+
+        self.filepathTable = filepathTable
 
         if (reset):
             create = True
@@ -510,18 +526,26 @@ class FileTable (Table):
     restoreList_select_subject = "SELECT p.filepath, f.fileowner, f.filegroup, f.filemode, f.filetime, s.filesha FROM file_v1 f JOIN filepath_v1 p ON p.id = f.filepath_id JOIN filesha_v1 s ON s.id = f.filesha_id WHERE f.run_id = ? AND p.filepath LIKE ?||'%'"
     
     
-    def __init__(self, dbh, readOnly = False, create = False, reset = False):
+    def __init__(self, dbh, readOnly = False, create = False, reset = False, filepathTable = None, fileshaTable = None, hostTable = None):
         """Sets up the FileTable object.  In addition to the basics, this
         instantiates a FilepathTable, FileshaTable and HostTable
         object and puts them on the FileTable object for reference
-        use.
+        use.  Any of the three may be passed in to be shared instead.
 
         """
         self.dbh = dbh
         self.readOnly = readOnly
-        self.filepathTable = FilepathTable(dbh, readOnly)
-        self.fileshaTable = FileshaTable(dbh, readOnly)
-        self.hostTable = HostTable(dbh, readOnly)
+
+        if (filepathTable is None):
+            filepathTable = FilepathTable(dbh, readOnly)
+        if (fileshaTable is None):
+            fileshaTable = FileshaTable(dbh, readOnly)
+        if (hostTable is None):
+            hostTable = HostTable(dbh, readOnly)
+
+        self.filepathTable = filepathTable
+        self.fileshaTable = fileshaTable
+        self.hostTable = hostTable
 
         if (reset):
             create = True
@@ -592,3 +616,127 @@ class FileTable (Table):
                            'filemode'  : result[3],
                            'filetime'  : result[4],
                            'filesha'   : result[5]}
+
+class Catalog:
+    """Implements a whole catalog: the schema version check, any pending
+    migrations, and one shared instance of each table.
+
+    The schema version is kept in SQLite's user_version pragma, so
+    opening a catalog that is already current costs a single query
+    instead of re-running every table's DDL.  Each entry in the
+    migrations list below holds the statements that take the catalog
+    from that version to the next one; the first entry builds the v1
+    tables from scratch.  Since those statements are all IF NOT
+    EXISTS, catalogs made before the version was recorded (which
+    report version 0) are simply stamped as current.
+
+    """
+
+    migrations = [
+        StatusTable.createTable_list +
+        HostTable.createTable_list +
+        FileshaTable.createTable_list +
+        FilepathTable.createTable_list +
+        RunTable.createTable_list +
+        DirectoryTable.createTable_list +
+        LinkTable.createTable_list +
+        FileTable.createTable_list
+    ]
+
+    dropCatalog_list = (
+        FileTable.dropTable_list +
+        LinkTable.dropTable_list +
+        DirectoryTable.dropTable_list +
+        RunTable.dropTable_list +
+        FilepathTable.dropTable_list +
+        FileshaTable.dropTable_list +
+        HostTable.dropTable_list +
+        StatusTable.dropTable_list
+    )
+
+    def __init__(self, dbh, readOnly = False, reset = False):
+        """Sets up the Catalog object.  Checks the schema version, bringing
+        it up to date unless readOnly is set, then builds the table
+        objects so that each one is instantiated exactly once and
+        shared by the tables that refer to it.  If reset is True,
+        everything is dropped and rebuilt first, which a read-only
+        catalog refuses to do.
+
+        """
+        if (readOnly and reset):
+            raise ValueError("A read-only catalog cannot be reset.")
+
+        self.dbh = dbh
+        self.readOnly = readOnly
+
+        if (reset):
+            self.dropCatalog()
+
+        version = self.getVersion()
+
+        if (version > len(self.migrations)):
+            raise RuntimeError("Catalog schema version %d is newer than the supported version %d." %(version, len(self.migrations)))
+
+        if ((version < len(self.migrations)) and not readOnly):
+            self.migrate(version)
+
+        self.statusTable = StatusTable(dbh, readOnly)
+        self.hostTable = HostTable(dbh, readOnly)
+        self.fileshaTable = FileshaTable(dbh, readOnly)
+        self.filepathTable = FilepathTable(dbh, readOnly)
+        self.runTable = RunTable(dbh, readOnly, statusTable = self.statusTable, hostTable = self.hostTable)
+        self.directoryTable = DirectoryTable(dbh, readOnly, filepathTable = self.filepathTable)
+        self.linkTable = LinkTable(dbh, readOnly, filepathTable = self.filepathTable)
+        self.fileTable = FileTable(dbh, readOnly, filepathTable = self.filepathTable, fileshaTable = self.fileshaTable, hostTable = self.hostTable)
+
+    def getVersion (self):
+        """Returns the schema version recorded in the catalog.
+
+        """
+        return self.dbh.execute("PRAGMA user_version").fetchone()[0]
+
+    def migrate (self, version):
+        """Applies every migration after the given version in a single
+        transaction and records the new version.  The migration is
+        committed on its own, so it refuses to start while the
+        connection has other work pending.
+
+        """
+        if (self.dbh.in_transaction):
+            raise RuntimeError("Cannot migrate the catalog while a transaction is open.")
+
+        self.dbh.execute("BEGIN")
+
+        try:
+            for migration in self.migrations[version:]:
+                for command in migration:
+                    self.dbh.execute(command)
+            self.dbh.execute("PRAGMA user_version = %d" % len(self.migrations))
+        except:
+            self.dbh.rollback()
+            raise
+
+        self.dbh.commit()
+
+    def dropCatalog (self):
+        """Drops every table and resets the schema version, so that the next
+        version check rebuilds the catalog from scratch.  As with
+        migrate, this refuses to run while other work is pending.
+
+        """
+        if (self.dbh.in_transaction):
+            raise RuntimeError("Cannot drop the catalog while a transaction is open.")
+
+        self.dbh.execute("BEGIN")
+
+        try:
+            for command in self.dropCatalog_list:
+                self.dbh.execute(command)
+            self.dbh.execute("PRAGMA user_version = 0")
+        except:
+            self.dbh.rollback()
+            raise
+
+        self.dbh.commit()
+
+SCHEMA_VERSION = len(Catalog.migrations)
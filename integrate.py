@@ -12,14 +12,12 @@ def main():
 
     destDB = sqlite3.connect(args.output)
 
-    statusTable = bumddb.StatusTable(destDB, create = True)
-    hostTable = bumddb.HostTable(destDB, create = True)
-    fileshaTable = bumddb.FileshaTable(destDB, create = True)
-    filepathTable = bumddb.FilepathTable(destDB, create = True)
-    runTable = bumddb.RunTable(destDB, create = True)
-    dirTable = bumddb.DirectoryTable(destDB, create = True)
-    linkTable = bumddb.LinkTable(destDB, create = True)
-    fileTable = bumddb.FileTable(destDB, create = True)
+    catalog = bumddb.Catalog(destDB)
+
+    runTable = catalog.runTable
+    dirTable = catalog.directoryTable
+    linkTable = catalog.linkTable
+    fileTable = catalog.fileTable
 
     for sourceDBPath in args.inputs:
         sourceDB = sqlite3.connect(sourceDBPath)
@@ -0,0 +1,240 @@
+#!/usr/bin/python3
+
+import argparse
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import sys
+import urllib.parse
+import bumddb
+
+# Each check is (table, column, problem, query).  Every query takes
+# the lower and upper bound of a range of the given column on its
+# table and returns the id of the offending row plus a detail value.
+# Duplicates are reported on the later row, with the id of the
+# earliest matching row as the detail, so each one is only reported
+# once.
+#
+# Most checks split on id and probe an index for an earlier matching
+# row.  directory_v1_idx does not include run_id, so that probe would
+# walk the same directory in every earlier run; its duplicate check
+# instead splits on filepath_id, the leading column of that index,
+# and partitions each range on its own.  link_v1_idx only holds
+# run_id, so link_v1 does the same over ranges of run_id.
+
+checks = [
+    ("run_v1", "id", "dangling host_id", "SELECT r.id, r.host_id FROM run_v1 r LEFT JOIN host_v1 h ON h.id = r.host_id WHERE r.id >= ? AND r.id < ? AND h.id IS NULL"),
+    ("run_v1", "id", "dangling status_id", "SELECT r.id, r.status_id FROM run_v1 r LEFT JOIN status_v1 s ON s.id = r.status_id WHERE r.id >= ? AND r.id < ? AND r.status_id IS NOT NULL AND s.id IS NULL"),
+    ("run_v1", "id", "missing status", "SELECT r.id, NULL FROM run_v1 r WHERE r.id >= ? AND r.id < ? AND r.status_id IS NULL"),
+    ("run_v1", "id", "missing endtime", "SELECT r.id, NULL FROM run_v1 r WHERE r.id >= ? AND r.id < ? AND r.endtime IS NULL"),
+    ("run_v1", "id", "duplicate", "SELECT r.id, MIN(o.id) FROM run_v1 r JOIN run_v1 o ON o.host_id = r.host_id AND o.starttime = r.starttime AND o.id < r.id WHERE r.id >= ? AND r.id < ? GROUP BY r.id"),
+
+    ("directory_v1", "id", "dangling run_id", "SELECT d.id, d.run_id FROM directory_v1 d LEFT JOIN run_v1 r ON r.id = d.run_id WHERE d.id >= ? AND d.id < ? AND r.id IS NULL"),
+    ("directory_v1", "id", "dangling filepath_id", "SELECT d.id, d.filepath_id FROM directory_v1 d LEFT JOIN filepath_v1 p ON p.id = d.filepath_id WHERE d.id >= ? AND d.id < ? AND p.id IS NULL"),
+    ("directory_v1", "filepath_id", "duplicate", "SELECT id, dup FROM (SELECT d.id, MIN(d.id) OVER (PARTITION BY d.filepath_id, d.fileowner, d.filegroup, d.filemode, d.filetime, d.run_id) AS dup FROM directory_v1 d WHERE d.filepath_id >= ? AND d.filepath_id < ?) WHERE id != dup"),
+
+    ("link_v1", "id", "dangling run_id", "SELECT l.id, l.run_id FROM link_v1 l LEFT JOIN run_v1 r ON r.id = l.run_id WHERE l.id >= ? AND l.id < ? AND r.id IS NULL"),
+    ("link_v1", "id", "dangling filepath_id", "SELECT l.id, l.filepath_id FROM link_v1 l LEFT JOIN filepath_v1 p ON p.id = l.filepath_id WHERE l.id >= ? AND l.id < ? AND p.id IS NULL"),
+    ("link_v1", "id", "dangling destpath_id", "SELECT l.id, l.destpath_id FROM link_v1 l LEFT JOIN filepath_v1 p ON p.id = l.destpath_id WHERE l.id >= ? AND l.id < ? AND p.id IS NULL"),
+    ("link_v1", "run_id", "duplicate", "SELECT id, dup FROM (SELECT l.id, MIN(l.id) OVER (PARTITION BY l.run_id, l.filepath_id, l.destpath_id) AS dup FROM link_v1 l WHERE l.run_id >= ? AND l.run_id < ?) WHERE id != dup"),
+
+    ("file_v1", "id", "dangling run_id", "SELECT f.id, f.run_id FROM file_v1 f LEFT JOIN run_v1 r ON r.id = f.run_id WHERE f.id >= ? AND f.id < ? AND r.id IS NULL"),
+    ("file_v1", "id", "dangling filepath_id", "SELECT f.id, f.filepath_id FROM file_v1 f LEFT JOIN filepath_v1 p ON p.id = f.filepath_id WHERE f.id >= ? AND f.id < ? AND p.id IS NULL"),
+    ("file_v1", "id", "dangling filesha_id", "SELECT f.id, f.filesha_id FROM file_v1 f LEFT JOIN filesha_v1 s ON s.id = f.filesha_id WHERE f.id >= ? AND f.id < ? AND s.id IS NULL"),
+    ("file_v1", "id", "duplicate", "SELECT f.id, MIN(o.id) FROM file_v1 f JOIN file_v1 o ON o.filepath_id = f.filepath_id AND o.filesize = f.filesize AND o.filetime = f.filetime AND o.run_id = f.run_id AND o.fileowner = f.fileowner AND o.filegroup = f.filegroup AND o.filemode = f.filemode AND o.filesha_id = f.filesha_id AND o.id < f.id WHERE f.id >= ? AND f.id < ? GROUP BY f.id"),
+
+    ("host_v1", "id", "duplicate", "SELECT h.id, MIN(o.id) FROM host_v1 h JOIN host_v1 o ON o.host = h.host AND o.id < h.id WHERE h.id >= ? AND h.id < ? GROUP BY h.id"),
+    ("status_v1", "id", "duplicate", "SELECT s.id, MIN(o.id) FROM status_v1 s JOIN status_v1 o ON o.status = s.status AND o.id < s.id WHERE s.id >= ? AND s.id < ? GROUP BY s.id"),
+    ("filepath_v1", "id", "duplicate", "SELECT p.id, MIN(o.id) FROM filepath_v1 p JOIN filepath_v1 o ON o.filepath = p.filepath AND o.id < p.id WHERE p.id >= ? AND p.id < ? GROUP BY p.id"),
+    ("filesha_v1", "id", "duplicate", "SELECT s.id, MIN(o.id) FROM filesha_v1 s JOIN filesha_v1 o ON o.filesha = s.filesha AND o.id < s.id WHERE s.id >= ? AND s.id < ? GROUP BY s.id"),
+    ("filesha_v1", "id", "malformed filesha", "SELECT s.id, s.filesha FROM filesha_v1 s WHERE s.id >= ? AND s.id < ? AND (s.filesha IS NULL OR length(s.filesha) != 64 OR s.filesha GLOB '*[^0-9a-f]*')"),
+]
+
+rehash_select = "SELECT s.id, s.filesha FROM filesha_v1 s WHERE s.id >= ? AND s.id < ? AND length(s.filesha) = 64 AND NOT s.filesha GLOB '*[^0-9a-f]*'"
+
+worker = {}
+
+def openReadOnly(path):
+    """Opens the catalog through a read-only URI so that the verifier can
+    never alter it, even by accident.
+
+    """
+    uri = "file:%s?mode=ro" % urllib.parse.quote(os.path.abspath(path))
+    return sqlite3.connect(uri, uri = True)
+
+def initWorker(path, content, sample):
+    """Runs once in each pool process to open that process's own
+    read-only connection.
+
+    """
+    worker['dbh'] = openReadOnly(path)
+    worker['content'] = content
+    worker['sample'] = sample
+
+def planChunks(dbh, chunkSize):
+    """Splits each table into ranges over each column that its checks
+    split on, each holding roughly chunkSize rows.  The ranges are
+    aligned on multiples of their width so that the plan comes out
+    the same from one run to the next, which is what lets an
+    interrupted verify pick up where it left off.
+
+    """
+    splits = []
+    for (table, column, problem, query) in checks:
+        if ((table, column) not in splits):
+            splits.append((table, column))
+
+    chunks = []
+    for (table, column) in splits:
+        (low, high) = dbh.execute("SELECT MIN(%s), MAX(%s) FROM %s" % (column, column, table)).fetchone()
+        if (low is None):
+            continue
+
+        width = chunkSize
+        if (column != "id"):
+            # Other columns repeat across rows, so scale the width by
+            # how many rows each value has, estimated from the span of
+            # ids.  Rounding down to a power of two keeps the plan
+            # stable until the table's shape changes by half again.
+            (firstId, lastId) = dbh.execute("SELECT MIN(id), MAX(id) FROM %s" % table).fetchone()
+            width = max(1, chunkSize * (high - low + 1) // (lastId - firstId + 1))
+            width = 1 << (width.bit_length() - 1)
+
+        for start in range((low // width) * width, high + 1, width):
+            chunks.append((table, column, start, start + width))
+
+    return chunks
+
+def chunkKey(chunk):
+    """Returns the name a chunk is recorded under in the state file.
+    Both ends of the range are included, so that a state file written
+    with one chunk size never marks rows done under another.
+
+    """
+    return "%s:%s:%d:%d" % chunk
+
+def hashFile(path):
+    """Returns the SHA256 of a file as a hex string.
+
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1048576), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def verifyChunk(chunk):
+    """Runs every check that splits on the chunk's table and column over
+    the chunk's range and, for filesha_v1 id chunks, re-hashes the
+    sampled content.  Returns the chunk along with its findings.
+
+    """
+    (table, column, start, end) = chunk
+    dbh = worker['dbh']
+    findings = []
+
+    for (checkTable, checkColumn, problem, query) in checks:
+        if ((checkTable, checkColumn) != (table, column)):
+            continue
+        for result in dbh.execute(query, (start, end)):
+            findings.append((table, result[0], problem, result[1]))
+
+    if ((table, column) == ("filesha_v1", "id") and (worker['content'] is not None)):
+        for (fileshaId, filesha) in dbh.execute(rehash_select, (start, end)):
+            # Sample on the hash itself so that the same content is
+            # picked every time, however the run is resumed.
+            if (int(filesha[:8], 16) >= worker['sample'] * 0x100000000):
+                continue
+            path = os.path.join(worker['content'], filesha)
+            try:
+                actual = hashFile(path)
+            except FileNotFoundError:
+                findings.append((table, fileshaId, "missing content", path))
+                continue
+            except OSError as error:
+                findings.append((table, fileshaId, "unreadable content", "%s: %s" % (path, error.strerror)))
+                continue
+            if (actual != filesha):
+                findings.append((table, fileshaId, "content mismatch", actual))
+
+    return (chunk, findings)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument ("catalog", help="Database to verify", type = str)
+    parser.add_argument ("--state", help="File recording finished chunks, so that an interrupted verify can be resumed", type = str)
+    parser.add_argument ("--content", help="Directory holding backed-up content, one file per SHA256 named by its hash", type = str)
+    parser.add_argument ("--sample", help="Fraction of content to re-hash (default 0.01)", type = float, default = 0.01)
+    parser.add_argument ("--chunk", help="Rows per unit of work (default 100000)", type = int, default = 100000)
+    parser.add_argument ("--jobs", help="Number of worker processes (default: one per CPU)", type = int)
+    args = parser.parse_args()
+
+    if (args.chunk <= 0):
+        parser.error("--chunk must be greater than 0")
+    if ((args.sample < 0) or (args.sample > 1)):
+        parser.error("--sample must be between 0 and 1")
+
+    dbh = openReadOnly(args.catalog)
+
+    version = dbh.execute("PRAGMA user_version").fetchone()[0]
+    if (version > bumddb.SCHEMA_VERSION):
+        sys.exit("Catalog schema version %d is newer than the supported version %d." %(version, bumddb.SCHEMA_VERSION))
+
+    chunks = planChunks(dbh, args.chunk)
+    dbh.close()
+
+    # The state file holds one line per finished chunk: its key and
+    # the number of findings it produced.  A line cut short by an
+    # interruption has no newline (and may have a truncated count),
+    # so it is dropped and that chunk is simply checked again.
+    done = {}
+    partial = False
+    if ((args.state is not None) and os.path.exists(args.state)):
+        with open(args.state) as stateFile:
+            for line in stateFile:
+                fields = line.split()
+                if ((not line.endswith("\n")) or (len(fields) != 2) or (not fields[1].isdigit())):
+                    partial = partial or not line.endswith("\n")
+                    continue
+                done[fields[0]] = int(fields[1])
+
+    pending = [chunk for chunk in chunks if chunkKey(chunk) not in done]
+    print ("Verifying", len(pending), "of", len(chunks), "chunks", file = sys.stderr)
+
+    earlierCount = sum(done[chunkKey(chunk)] for chunk in chunks if chunkKey(chunk) in done)
+    if (earlierCount > 0):
+        print ("Earlier sessions found", earlierCount, "problems", file = sys.stderr)
+
+    stateFile = None
+    if (args.state is not None):
+        stateFile = open(args.state, "a")
+        if (partial):
+            stateFile.write("\n")
+
+    findingCount = 0
+    pool = multiprocessing.Pool(args.jobs, initWorker, (args.catalog, args.content, args.sample))
+    try:
+        for (chunk, findings) in pool.imap_unordered(verifyChunk, pending):
+            for finding in findings:
+                print ("%s\t%s\t%s\t%s" % finding)
+            sys.stdout.flush()
+            findingCount += len(findings)
+
+            # Only mark the chunk done once its findings are out.
+            if (stateFile is not None):
+                stateFile.write("%s %d\n" % (chunkKey(chunk), len(findings)))
+                stateFile.flush()
+    finally:
+        pool.terminate()
+        if (stateFile is not None):
+            stateFile.close()
+
+    findingCount += earlierCount
+
+    print ("Found", findingCount, "problems", file = sys.stderr)
+    if (findingCount > 0):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()